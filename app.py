@@ -1,7 +1,17 @@
+import io
+import os
+import sqlite3
+import hashlib
+import inspect
+from pathlib import Path
 import streamlit as st
 import streamlit.components.v1 as components
+import requests
+import requests_cache
 import pandas as pd
-import plotly.express as px
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
 from datetime import date, timedelta
 
 FAVICON_URL = "https://raw.githubusercontent.com/Spolders/ST-Teamcast-POC/main/tc_logo_dark_512.png"
@@ -24,14 +34,34 @@ components.html("""
 </script>
 """, height=0, width=0)
 
-px.defaults.template = "plotly_dark"
-px.defaults.color_discrete_sequence = ["#4EA8DE", "#73C2FB", "#9AD6FF"]  # lighter blues
+# static figure styling shared by both charts, applied with a single update per figure
+_COLOR = "#4EA8DE"  # lighter blue
+_MAX_BOX_POINTS = 2000  # above this, the box plot shows only the summary statistics
+
+# plotly_dark with transparent backgrounds baked in, registered by name once per server process
+# (pio.templates outlives script reruns, so the template is not rebuilt on every interaction)
+_TEMPLATE = "teamcast_dark"
+if _TEMPLATE not in pio.templates:
+    _dark = go.layout.Template(pio.templates["plotly_dark"])
+    _dark.layout.update(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)")
+    pio.templates[_TEMPLATE] = _dark
+
+_BOX_LAYOUT = dict(xaxis_title="Date of Forecast (=D-1)", yaxis_title="DAA Hi-Lo Spread (€)")
+
+_BAR_LAYOUT = dict(
+    yaxis={"categoryorder": "total descending"},
+    yaxis_title="Forecaster Name or Nickname",
+    xaxis_title="Mean Absolute Error (€)",
+    bargap=0.3,
+    margin=dict(l=10, r=10, t=60, b=10),
+)
 
-def darkify(fig):
-    return fig.update_layout(
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)"
-    )
+_BAR_TRACES = dict(
+    texttemplate="%{text:.2f}",
+    textposition="outside",
+    cliponaxis=False,
+    hovertemplate="%{y}<br>Avg Error: %{x:.2f}€<extra></extra>",
+)
 
 LOGO_URL = "https://raw.githubusercontent.com/Spolders/ST-Teamcast-POC/main/logo.png"
 
@@ -47,42 +77,179 @@ with hdr:
 DATA_URL = "https://raw.githubusercontent.com/Spolders/ST-Teamcast-POC/refs/heads/main/data/Teamcast-Ensemble.csv"
 CONTACT_URL = "https://raw.githubusercontent.com/Spolders/ST-Teamcast-POC/refs/heads/Staging/Forecasters/contacts.csv"
 
+# -------- HTTP FETCH --------
+# on-disk caches (HTTP responses, parsed frames) live in one fixed directory, independent of the cwd
+_CACHE_DIR = Path.home() / ".cache" / "teamcast"
+
+@st.cache_resource
+def http_session() -> requests_cache.CachedSession:
+    # on-disk HTTP cache below st.cache_data, so restarts and cache evictions reuse the last download
+    # (expired entries are revalidated with If-None-Match / If-Modified-Since, so an unchanged file is a 304)
+    # one session per server process, not one per script rerun
+    try:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        return requests_cache.CachedSession(str(_CACHE_DIR / "http_cache"), expire_after=1800)
+    except (OSError, sqlite3.Error):
+        # no writable cache directory (read-only or missing $HOME): keep caching in memory only
+        return requests_cache.CachedSession(backend="memory", expire_after=1800)
+
+def fetch(url: str) -> requests.Response:
+    resp = http_session().get(url)
+    resp.raise_for_status()
+    return resp
+
+def fetch_csv(url: str) -> io.BytesIO:
+    return io.BytesIO(fetch(url).content)
+
 # -------- DATA LOADER --------
+# spreadsheet error values exported into the CSV, treated as missing on top of pandas' defaults
+_NA_VALUES = ["#DIV/0!", "#VALUE!", "#REF!", "#NUM!", "#NAME?", "#NULL!"]
+
 @st.cache_data
 def load_data(url: str) -> pd.DataFrame:
-    df = pd.read_csv(url)
+    resp = fetch(url)
+    etag = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+    path = _CACHE_DIR / f"{hashlib.sha1(url.encode()).hexdigest()}.pkl"
+    # parser + library fingerprint, so a deploy that changes parse_data, pandas or numpy
+    # never reuses frames the old code built
+    version = hashlib.sha1(
+        (inspect.getsource(parse_data) + repr(_NA_VALUES) + pd.__version__ + np.__version__).encode()
+    ).hexdigest()
+
+    # same file on the server and same parser as last time: reuse the parsed frame
+    if etag and path.exists():
+        # the pickle is only an optimisation: anything wrong with it (corrupt, written by
+        # other library versions, old layout) is a cache miss, never an error
+        try:
+            cached = pd.read_pickle(path)
+            if isinstance(cached, tuple) and cached[:2] == (version, etag):
+                return cached[2]
+        except Exception:
+            pass
+
+    df = parse_data(io.BytesIO(resp.content))
+
+    if etag:
+        try:
+            _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            pd.to_pickle((version, etag, df), tmp)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    return df
+
+def parse_data(buf: io.BytesIO) -> pd.DataFrame:
     # expected columns: Date, Forecasted value, Pseudonym, Actual value, (optional) Absolute Error
-    # normalize types
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    if "Forecasted value" in df.columns:
-        df["Forecasted value"] = pd.to_numeric(df["Forecasted value"], errors="coerce")
-    if "Actual value" in df.columns:
-        df["Actual value"] = pd.to_numeric(df["Actual value"], errors="coerce")
+    # typed parse in a single Arrow pass; spreadsheet error cells (#DIV/0! etc.) read as NaN
+    df = pd.read_csv(
+        buf,
+        engine="pyarrow",
+        parse_dates=["Date"],
+        na_values=_NA_VALUES,
+    )
+
+    # coercing fallback for columns Arrow could not type (e.g. mixed date formats, stray text)
+    if not pd.api.types.is_datetime64_any_dtype(df["Date"]):
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce", format="mixed")
+    for c in ("Forecasted value", "Actual value", "Absolute Error"):
+        if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    # keep rows in date order so the date window can be taken as a contiguous slice
+    df = df.sort_values("Date", kind="stable").reset_index(drop=True)
+
+    # add normalized forecast_date (calendar day, kept as datetime64 so filters/groupbys stay vectorized)
+    df["Forecast date"] = df["Date"].dt.normalize()
+    # string label for the categorical x axis, formatted once per data refresh
+    df["date_label"] = df["Date"].dt.strftime("%Y-%m-%d")
 
-    # add normalized forecast_date (calendar day)
-    df["Forecast date"] = df["Date"].dt.date
+    # low-cardinality stream names: group on integer category codes
+    df["Pseudonym"] = df["Pseudonym"].astype("category")
 
     # compute absolute error if not provided (or if NaNs present)
     if "Absolute Error" not in df.columns:
         df["Absolute Error"] = (df["Forecasted value"] - df["Actual value"]).abs()
     else:
-        # ensure numeric and fill if missing
-        df["Absolute Error"] = pd.to_numeric(df["Absolute Error"], errors="coerce")
-        missing_mask = df["Absolute Error"].isna() & df["Forecasted value"].notna() & df["Actual value"].notna()
-        df.loc[missing_mask, "Absolute Error"] = (df.loc[missing_mask, "Forecasted value"] - df.loc[missing_mask, "Actual value"]).abs()
+        # fill only the gaps; skip entirely when the CSV already carries every error
+        fc = df["Forecasted value"].to_numpy()
+        act = df["Actual value"].to_numpy()
+        missing_mask = df["Absolute Error"].isna().to_numpy() & ~np.isnan(fc) & ~np.isnan(act)
+        if missing_mask.any():
+            df.loc[missing_mask, "Absolute Error"] = np.abs(fc[missing_mask] - act[missing_mask])
+
+    # spreads don't need FP64: halve memory and bytes scanned by the aggregations
+    for c in ("Forecasted value", "Actual value", "Absolute Error"):
+        df[c] = df[c].astype("float32")
 
     return df
 
-df = load_data(DATA_URL)
+# -------- SUMMARY (cached per calendar day) --------
+@st.cache_data(ttl=3600)
+def build_summary(url: str, today: date) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    df = load_data(url)
+
+    # safety: keep only last 14 days if a longer file is ever uploaded
+    end_d = np.datetime64(today, "D")
+    start_d = np.datetime64(today - timedelta(days=14), "D")
+    lo, hi = np.searchsorted(df["Forecast date"].to_numpy(), [start_d, end_d + np.timedelta64(1, "D")])
+    df_recent = df.iloc[lo:hi]
+
+    # box-plot statistics per forecast day (quartiles + Tukey fences), so the chart ships O(days) numbers
+    has_fc = df_recent["Forecasted value"].notna()
+    forecasts = df_recent.loc[has_fc, "Forecasted value"].to_numpy()
+    labels = df_recent.loc[has_fc, "date_label"].to_numpy()
+    rows = []
+    # rows are date-sorted, so each day is a contiguous run
+    days, starts = np.unique(labels, return_index=True)
+    for s, e in zip(starts, np.r_[starts[1:], len(forecasts)]):
+        v = forecasts[s:e]
+        # method="hazen" is plotly.js's default quartilemethod="linear"
+        q1, median, q3 = np.quantile(v, [0.25, 0.5, 0.75], method="hazen")
+        iqr = q3 - q1
+        rows.append((q1, median, q3, v[v >= q1 - 1.5 * iqr].min(), v[v <= q3 + 1.5 * iqr].max()))
+    box_stats = pd.DataFrame(rows, index=days, columns=["q1", "median", "q3", "lowerfence", "upperfence"])
+
+    # keep only rows where forecast, actual and error exist; both aggregations read this frame
+    valid = df_recent.dropna(subset=["Forecasted value", "Actual value", "Pseudonym", "Absolute Error"])
+
+    # per-stream mean absolute error: accumulate sums/counts over the integer category codes
+    streams = valid["Pseudonym"].cat
+    n_streams = len(streams.categories)
+    codes = streams.codes.to_numpy()
+    counts = np.bincount(codes, minlength=n_streams)
+    err_sums = np.bincount(codes, weights=valid["Absolute Error"].to_numpy(), minlength=n_streams)
+    seen = counts > 0  # observed streams only
+    names = streams.categories.to_numpy()[seen]
+    errors = err_sums[seen] / counts[seen]
+
+    # ensemble statistics per day (mean & median across streams vs actual)
+    if not valid.empty:
+        # rows are date-sorted, so each day is a contiguous run: reduce over the run boundaries
+        fc = valid["Forecasted value"].to_numpy()
+        act = valid["Actual value"].to_numpy()
+        _, starts = np.unique(valid["Forecast date"].to_numpy(), return_index=True)
+        ends = np.r_[starts[1:], len(valid)]
+
+        mean_fc = np.add.reduceat(fc, starts) / (ends - starts)
+        median_fc = np.array([np.median(fc[s:e]) for s, e in zip(starts, ends)])
+        actual = act[starts]  # first actual per day
+
+        names = np.concatenate([names, ["Mean of ensemble", "Median of ensemble"]])
+        errors = np.concatenate([errors, [np.abs(mean_fc - actual).mean(), np.abs(median_fc - actual).mean()]])
 
-# safety: keep only last 14 days if a longer file is ever uploaded
-end_d = date.today()
-start_d = end_d - timedelta(days=14)
-df_recent = df[(df["Forecast date"] >= start_d) & (df["Forecast date"] <= end_d)].copy()
+    # rank low -> high error on the small arrays, then build the frame once
+    order = np.argsort(errors, kind="stable")
+    summary = pd.DataFrame({"Name": names[order], "Average Error": errors[order]})
+
+    return df_recent, box_stats, summary
+
+df_recent, box_stats, summary = build_summary(DATA_URL, date.today())
 
 @st.cache_data
 def load_contacts(url: str) -> pd.DataFrame:
-    c = pd.read_csv(url)
+    c = pd.read_csv(fetch_csv(url))
     c["Forecast name"] = c["Forecast name"].astype(str).str.strip()
     c["Forecaster"] = c["Forecaster"].astype(str).str.strip()
     c["Forecast profile"] = c["Forecast profile"].astype(str).str.strip()
@@ -90,101 +257,83 @@ def load_contacts(url: str) -> pd.DataFrame:
 
 contacts = load_contacts(CONTACT_URL)
 
-st.title("Collaborative Forecast German DA Spread")
-st.link_button("Learn more about Teamcast", "https://www.flexup.pro/faq")
-
-# -------- BOXPLOT (Distribution by Forecast Date) --------
-if df_recent.empty or df_recent["Forecasted value"].dropna().empty:
-    st.warning("No forecast data available for the last 14 days.")
-else:
-    # Make a label column for categorical x and fix the sort order
-    df_recent = df_recent.copy()
-    df_recent["date_label"] = pd.to_datetime(df_recent["Forecast date"]).dt.strftime("%Y-%m-%d")
-    order = sorted(df_recent["date_label"].unique())
+# -------- FIGURES --------
+def build_box(df_recent: pd.DataFrame, box_stats: pd.DataFrame) -> go.Figure:
+    # box_stats is indexed by the sorted date labels, which also fixes the x-axis order
+    order = box_stats.index.to_numpy()
 
     # compute bounds
     ymin = float(df_recent["Forecasted value"].min())
     ymax = float(df_recent["Forecasted value"].max())
 
-    fig_box = px.box(
-        df_recent.dropna(subset=["Forecasted value"]),
-        x="date_label",
-        y="Forecasted value",
-        points="all",
-        labels={
-            "date_label": "Date of Forecast (=D-1)",
-            "Forecasted value": "Forecast Hi-Lo Spread (€)",
-        },
+    # boxes from the precomputed statistics; Plotly does not see the raw rows
+    traces = [go.Box(
+        x=order,
+        q1=box_stats["q1"].to_numpy(),
+        median=box_stats["median"].to_numpy(),
+        q3=box_stats["q3"].to_numpy(),
+        lowerfence=box_stats["lowerfence"].to_numpy(),
+        upperfence=box_stats["upperfence"].to_numpy(),
+        marker_color=_COLOR,
+    )]
+
+    # individual forecasts as one WebGL scatter trace, only while the point count stays small
+    has_fc = df_recent["Forecasted value"].notna()
+    if has_fc.sum() <= _MAX_BOX_POINTS:
+        box_data = df_recent.loc[has_fc]
+        traces.append(go.Scattergl(
+            x=box_data["date_label"].to_numpy(),
+            y=box_data["Forecasted value"].to_numpy(),
+            mode="markers",
+            marker=dict(color=_COLOR, opacity=0.4),
+            hovertemplate="Date of Forecast (=D-1)=%{x}<br>Forecast Hi-Lo Spread (€)=%{y}<extra></extra>",
+        ))
+
+    fig_box = go.Figure(traces, layout=dict(template=_TEMPLATE))
+    fig_box.update_layout(
+        showlegend=False,
+        **_BOX_LAYOUT,
         title="Ensemble Forecast of Day-Ahead Auction DE-LU Hi-Lo Spreads (Last 14 Days)",
-        range_y=[min(0.0, ymin), ymax + 50],
+        xaxis_categoryorder="array",
+        xaxis_categoryarray=order,
+        yaxis_range=[min(0.0, ymin), ymax + 50],
+    )
+    return fig_box
+
+def build_bar(summary: pd.DataFrame) -> go.Figure:
+    errors = summary["Average Error"].to_numpy()
+    bar_fig = go.Figure(go.Bar(
+        x=errors,
+        y=summary["Name"].to_numpy(),
+        orientation="h",
+        text=errors,
+        marker_color=_COLOR,
+        **_BAR_TRACES,
+    ), layout=dict(template=_TEMPLATE))
+    bar_fig.update_layout(
+        **_BAR_LAYOUT,
+        title="Ranking: Mean Absolute Forecast Error by Forecaster and Ensemble (Last 14 Days)",
     )
-    
-    fig_box.update_layout(xaxis_title="Date of Forecast (=D-1)", yaxis_title="DAA Hi-Lo Spread (€)")
-    st.plotly_chart(fig_box, width="stretch")
+    return bar_fig
+
+st.title("Collaborative Forecast German DA Spread")
+st.link_button("Learn more about Teamcast", "https://www.flexup.pro/faq")
+
+# -------- BOXPLOT (Distribution by Forecast Date) --------
+if box_stats.empty:
+    st.warning("No forecast data available for the last 14 days.")
+else:
+    st.plotly_chart(build_box(df_recent, box_stats), width="stretch")
 
 st.caption("Data updates daily. Contact us for forward-looking data and API access.")
 
 # -------- BAR CHART (Forecaster Ranking by Mean Absolute Error) --------
-if df_recent.empty or df_recent["Absolute Error"].dropna().empty:
+if df_recent["Absolute Error"].isna().all():
     st.warning("No error data available to calculate average errors.")
+elif summary.empty:
+    st.warning("Insufficient data to compute the error summary.")
 else:
-    # per-stream mean absolute error
-    per_stream = (
-        df_recent
-        .dropna(subset=["Pseudonym", "Absolute Error"])
-        .groupby("Pseudonym", as_index=False)["Absolute Error"]
-        .mean()
-        .rename(columns={"Pseudonym": "Name", "Absolute Error": "Average Error"})
-    )
-
-    # ensemble statistics per day (mean & median across streams vs actual)
-    # keep only rows where both forecast and actual exist
-    valid = df_recent.dropna(subset=["Forecasted value", "Actual value"]).copy()
-    if not valid.empty:
-        daily = (
-            valid.groupby("Forecast date")
-                 .agg(mean_fc=("Forecasted value", "mean"),
-                      median_fc=("Forecasted value", "median"),
-                      actual=("Actual value", "first"))
-                 .reset_index()
-        )
-        daily["Mean Error"] = (daily["mean_fc"] - daily["actual"]).abs()
-        daily["Median Error"] = (daily["median_fc"] - daily["actual"]).abs()
-
-        ensemble_rows = pd.DataFrame({
-            "Name": ["Mean of ensemble", "Median of ensemble"],
-            "Average Error": [daily["Mean Error"].mean(), daily["Median Error"].mean()]
-        })
-    else:
-        ensemble_rows = pd.DataFrame({"Name": [], "Average Error": []})
-
-    summary = pd.concat([per_stream, ensemble_rows], ignore_index=True)
-    summary = summary.sort_values("Average Error", ascending=True)
-
-    if summary.empty:
-        st.warning("Insufficient data to compute the error summary.")
-    else:
-        bar_fig = px.bar(
-            summary,
-            x="Average Error",
-            y="Name",
-            orientation="h",
-            title="Ranking: Mean Absolute Forecast Error by Forecaster and Ensemble (Last 14 Days)",
-            text="Average Error",
-        )
-        bar_fig.update_traces(texttemplate="%{text:.2f}", textposition="outside", cliponaxis=False)
-        bar_fig.update_layout(
-            yaxis={"categoryorder": "total descending"},
-            yaxis_title="Forecaster Name or Nickname",
-            xaxis_title="Mean Absolute Error (€)",
-            bargap=0.3,
-            margin=dict(l=10, r=10, t=60, b=10)
-        )
-        bar_fig.update_traces(
-        hovertemplate="%{y}<br>Avg Error: %{x:.2f}€<extra></extra>"
-        )
-
-        st.plotly_chart(bar_fig, width="stretch")
+    st.plotly_chart(build_bar(summary), width="stretch")
 
 # -------- CONTACT FORECASTERS --------
 st.subheader("Forecast Profiles")